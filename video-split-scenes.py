@@ -1,16 +1,330 @@
 import argparse
+import bisect
+import concurrent.futures
+import hashlib
+import json
+import math
 import subprocess
 import re
 import os
+import sys
+
+# Matches either a blackdetect range or the input Duration header line in
+# the detect pass stderr, compiled once. A bytes pattern: the streamed
+# output is scanned undecoded and only the matched tokens reach float()/int()
+DETECT_RE = re.compile(rb'black_start:(\d+(?:\.\d+)?).*?black_end:(\d+(?:\.\d+)?)|Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+# Options shared by every ffmpeg invocation: no interactive stdin, no
+# banner dump, and no per-second progress lines on stderr
+FFMPEG_COMMON = ['-nostdin', '-hide_banner', '-nostats']
 
 def run_command(cmd):
     """Run a command and return its output."""
     try:
-        return subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+        # close_fds=False keeps subprocess on the cheap posix_spawn path
+        # instead of closing every possible fd after fork; nothing sensitive
+        # is inheritable here
+        return subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True, close_fds=False)
     except subprocess.CalledProcessError as e:
         print(f"Error running command: {e.output}")
         return ""
 
+def run_command_streaming(cmd, line_regex):
+    """Run a command and yield regex matches from its stderr, line by line.
+
+    Unlike run_command, this does not buffer the full output in memory:
+    each stderr line is matched and discarded while the process is still
+    running, so parsing overlaps with the command's own work and memory
+    use stays constant regardless of how much the command prints. Lines
+    are left as raw bytes - decoding megabytes of log text just to pull
+    out a few numeric tokens is wasted codec work.
+
+    Args:
+        cmd: The command to run.
+        line_regex: A compiled bytes regex searched against each stderr line.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, close_fds=False)
+    for line in process.stderr:
+        match = line_regex.search(line)
+        if match:
+            yield match
+    process.stderr.close()
+    if process.wait() != 0:
+        print(f"Error running command: {' '.join(cmd)}")
+
+def iter_command_stdout(cmd):
+    """Run a command and yield its stdout lines as they are produced.
+
+    The stdout counterpart to run_command_streaming: lines are consumed
+    while the process runs instead of buffering the whole transcript in
+    memory first. Lines are yielded as raw bytes.
+
+    Args:
+        cmd: The command to run.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, close_fds=False)
+    for line in process.stdout:
+        yield line
+    process.stdout.close()
+    if process.wait() != 0:
+        print(f"Error running command: {' '.join(cmd)}")
+
+def coalesce_black_frames(black_frames, gap):
+    """Merge overlapping or near-duplicate black segments.
+
+    ffmpeg can emit overlapping detections when a fade flickers; segments
+    separated by less than the detection duration are really one
+    transition and would otherwise produce spurious split points.
+
+    Args:
+        black_frames: A sorted list of (start, end) black segments.
+        gap: Maximum gap in seconds between segments for them to be merged.
+    """
+    coalesced = []
+    for start, end in black_frames:
+        if coalesced and start - coalesced[-1][1] < gap:
+            previous_start, previous_end = coalesced[-1]
+            coalesced[-1] = (previous_start, max(previous_end, end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+def detect_black_frames(video_file, duration, pic_th, pix_th, detect_height, cpu_only=False):
+    """Detect black frame ranges with ffmpeg, sorted by start time.
+
+    The frames are downscaled before blackdetect: a black frame is black at
+    any resolution, and analyzing fewer pixels makes the pass much cheaper
+    on high-resolution sources. Streams the blackdetect output through the
+    parser. -nostats drops the per-second progress lines so stderr is
+    mostly blackdetect output. The video duration is picked up from the
+    Duration header ffmpeg prints on the same stderr, saving a separate
+    ffprobe call later.
+
+    Returns:
+        A (black_frames, media_duration) tuple, where media_duration may be
+        None if ffmpeg printed no Duration line.
+
+    Args:
+        video_file: Path to the input video file.
+        duration: Minimum duration of a black scene in seconds.
+        pic_th: Picture black ratio threshold.
+        pix_th: Pixel brightness threshold.
+        detect_height: Height to downscale frames to before analysis, or 0
+            to analyze at the source resolution.
+        cpu_only: Disable GPU-accelerated decoding and decode on the CPU.
+    """
+    detect_filter = f'blackdetect=d={duration}:pic_th={pic_th}:pix_th={pix_th}'
+    if detect_height > 0:
+        detect_filter = f'scale=-2:{detect_height},{detect_filter}'
+    # Detection is decode-bound; -hwaccel auto offloads the decode to the
+    # GPU when one is available and quietly falls back to CPU otherwise
+    hwaccel = [] if cpu_only else ['-hwaccel', 'auto']
+    # blackdetect logs its ranges at the info level
+    ffmpeg_detect_cmd = ['ffmpeg'] + FFMPEG_COMMON + ['-loglevel', 'info'] + hwaccel + ['-i', video_file, '-vf', detect_filter, '-an', '-f', 'null', '-']
+    black_frames = []
+    media_duration = None
+    for match in run_command_streaming(ffmpeg_detect_cmd, DETECT_RE):
+        if match.group(1) is not None:
+            black_frames.append((float(match.group(1)), float(match.group(2))))
+        else:
+            hours, minutes, seconds = match.group(3), match.group(4), match.group(5)
+            media_duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    black_frames.sort(key=lambda x: x[0])
+    return coalesce_black_frames(black_frames, duration), media_duration
+
+def detect_keyframes(video_file):
+    """Detect keyframe timestamps with ffprobe, sorted ascending.
+
+    Scans packet headers only: keyframe packets carry the K flag in the
+    container index, so no frame decoding is needed.
+
+    Args:
+        video_file: Path to the input video file.
+    """
+    ffprobe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_packets', '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_file]
+    # ffprobe emits packets in stream order, so keyframe timestamps arrive
+    # monotonically increasing in practice; deduplicate against the previous
+    # value during collection and only pay for a sort if that assumption is
+    # ever violated
+    keyframes = []
+    sorted_input = True
+    for line in iter_command_stdout(ffprobe_cmd):
+        fields = line.rstrip().split(b',')
+        if len(fields) >= 2 and fields[1].startswith(b'K') and fields[0] != b'N/A':
+            # Millisecond resolution is plenty; rounding keeps near-identical
+            # timestamps from piling up as distinct keyframes. Always round
+            # toward zero: the segment muxer cuts at the first keyframe at or
+            # after each split time, so a split time rounded above the true
+            # keyframe pts would skip that keyframe and cut a GOP late
+            timestamp = math.floor(float(fields[0]) * 1000) / 1000
+            if keyframes:
+                if timestamp == keyframes[-1]:
+                    continue
+                if timestamp < keyframes[-1]:
+                    sorted_input = False
+            keyframes.append(timestamp)
+    if not sorted_input:
+        keyframes.sort()
+        keyframes = [t for i, t in enumerate(keyframes) if i == 0 or t != keyframes[i - 1]]
+    return keyframes
+
+def container_duration(video_file):
+    """Read the container's reported duration in seconds, or None.
+
+    Only the container header is read, so this is cheap enough to run
+    before committing to the full detection passes.
+
+    Args:
+        video_file: Path to the input video file.
+    """
+    output = run_command(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_file])
+    try:
+        return float(output.strip())
+    except ValueError:
+        return None
+
+def detection_cache_path(video_file, duration, pic_th, pix_th, detect_height):
+    """Return the cache file path for the detection results of a video.
+
+    The cache key covers the video's path, size, and modification time plus
+    every parameter that affects detection, so changing any of them leads
+    to a fresh detection run.
+
+    Args:
+        video_file: Path to the input video file.
+        duration: Minimum duration of a black scene in seconds.
+        pic_th: Picture black ratio threshold.
+        pix_th: Pixel brightness threshold.
+        detect_height: Height frames are downscaled to before analysis.
+    """
+    video_path = os.path.abspath(video_file)
+    stat = os.stat(video_path)
+    key = f'{video_path}:{stat.st_size}:{stat.st_mtime_ns}:{duration}:{pic_th}:{pix_th}:{detect_height}'
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(os.path.dirname(video_path), f'.videosplit-{digest}.json')
+
+def load_detection_cache(cache_path):
+    """Load cached detection results, or None if absent or unreadable."""
+    try:
+        with open(cache_path) as cache_file:
+            cached = json.load(cache_file)
+        return [tuple(bf) for bf in cached['black_frames']], cached['keyframes'], cached['media_duration']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_detection_cache(cache_path, black_frames, keyframes, media_duration):
+    """Save detection results so later runs can skip the detection passes."""
+    try:
+        with open(cache_path, 'w') as cache_file:
+            json.dump({'black_frames': black_frames, 'keyframes': keyframes, 'media_duration': media_duration}, cache_file)
+    except OSError:
+        pass  # The cache is only an optimization, a read-only directory is fine
+
+def extract_segment(video_file, start, end, output_file):
+    """Build the ffmpeg command to stream-copy a segment of the video.
+
+    The segment is described by absolute endpoints so rounding errors
+    cannot accumulate across segments; the length is recomputed per
+    segment for -t. (-to would not work here: input-side -ss resets the
+    timestamps to zero, making an absolute -to behave like a duration.)
+
+    Args:
+        video_file: Path to the input video file.
+        start: Start time of the segment in seconds.
+        end: Absolute end time of the segment in seconds, or None to copy
+            until the end of the file.
+        output_file: Path of the output file.
+    """
+    cmd = ['ffmpeg'] + FFMPEG_COMMON + ['-loglevel', 'error', '-ss', str(start), '-i', video_file]
+    if end is not None:
+        cmd += ['-t', str(end - start)]
+    cmd += ['-c', 'copy', output_file]
+    return cmd
+
+def run_extraction_jobs(video_file, jobs, max_workers):
+    """Run the segment extraction jobs in parallel.
+
+    Each job is a stream copy (no re-encoding), so the work is I/O bound and
+    threads are enough to keep multiple ffmpeg processes busy.
+
+    Args:
+        video_file: Path to the input video file.
+        jobs: A list of (start, end, output_file) tuples, where end may be
+            None to copy until the end of the file.
+        max_workers: Maximum number of concurrent ffmpeg processes, or 0 to
+            default to half the CPU cores.
+    """
+    if not jobs:
+        return
+    if max_workers <= 0:
+        max_workers = max((os.cpu_count() or 2) // 2, 1)
+    max_workers = min(max_workers, len(jobs))
+
+    def run_job(job):
+        start, end, output_file = job
+        print(f"Processing '{output_file}' (starts at {start}s)...")
+        cmd = extract_segment(video_file, start, end, output_file)
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, close_fds=False)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_job, job): job[2] for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if result.returncode != 0:
+                print(f"Error extracting '{futures[future]}': {result.stderr}")
+
+def split_video(video_file, split_points, output_names, max_workers):
+    """Cut the video at the given timestamps in a single ffmpeg pass.
+
+    The segment muxer reads the container once and cuts at every timestamp,
+    instead of re-opening and re-seeking the input for each scene. The
+    numbered segment files are renamed to the expected scene names
+    afterwards. Falls back to parallel per-segment extraction if the
+    single-pass run fails.
+
+    Args:
+        video_file: Path to the input video file.
+        split_points: Sorted timestamps (in seconds) to cut at.
+        output_names: Output file name for each resulting segment, in order.
+            Must hold one more entry than split_points.
+        max_workers: Maximum number of concurrent ffmpeg processes for the
+            fallback path.
+    """
+    if not output_names:
+        return
+
+    # Jobs for the fallback path: contiguous segments between split points
+    jobs = []
+    segment_start = 0
+    for i, output_name in enumerate(output_names):
+        segment_end = split_points[i] if i < len(split_points) else None
+        jobs.append((segment_start, segment_end, output_name))
+        segment_start = segment_end
+
+    if not split_points:
+        # Nothing to cut, just copy the single segment
+        run_extraction_jobs(video_file, jobs, max_workers)
+        return
+
+    _, file_extension = os.path.splitext(video_file)
+    segment_pattern = f'segment_%03d{file_extension}'
+    segment_times = ','.join(str(t) for t in split_points)
+    ffmpeg_segment_cmd = ['ffmpeg'] + FFMPEG_COMMON + ['-loglevel', 'error', '-i', video_file,
+                          '-c', 'copy', '-map', '0', '-f', 'segment', '-segment_times', segment_times,
+                          '-reset_timestamps', '1', segment_pattern]
+    print("Splitting video in a single pass...")
+    result = subprocess.run(ffmpeg_segment_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, close_fds=False)
+    if result.returncode != 0:
+        print(f"Single-pass split failed, falling back to per-scene extraction: {result.stderr}")
+        run_extraction_jobs(video_file, jobs, max_workers)
+        return
+
+    # Rename the numbered segments to the expected scene names
+    for i, output_name in enumerate(output_names):
+        segment_file = segment_pattern % i
+        if os.path.exists(segment_file):
+            os.rename(segment_file, output_name)
+
 def find_nearest_keyframe(keyframes, transition_start, transition_end):
     """Find the nearest keyframe to the midpoint of a transition.
 
@@ -21,27 +335,24 @@ def find_nearest_keyframe(keyframes, transition_start, transition_end):
     4. Return the nearest keyframe to the midpoint.
 
     Args:
-        keyframes: A list of keyframe timestamps.
-        midpoint: The midpoint of the transition.
+        keyframes: A sorted list of keyframe timestamps.
         transition_start: The start of the transition.
         transition_end: The end of the transition.
     """
 
-    midpoint = (start + end) / 2
-    before_midpoint = [kf for kf in keyframes if kf <= midpoint]
-    after_midpoint = [kf for kf in keyframes if kf >= midpoint]
+    midpoint = (transition_start + transition_end) / 2
+    idx = bisect.bisect_right(keyframes, midpoint)
+    nearest_before = keyframes[idx - 1] if idx > 0 else None
+    nearest_after = keyframes[idx] if idx < len(keyframes) else None
 
-    if not before_midpoint and not after_midpoint:
+    if nearest_before is None and nearest_after is None:
         return None  # No keyframes in transition
-    
-    if not before_midpoint:
-        return after_midpoint[0]
-    
-    if not after_midpoint:
-        return before_midpoint[-1]
 
-    nearest_before = before_midpoint[-1]
-    nearest_after = after_midpoint[0]
+    if nearest_before is None:
+        return nearest_after
+
+    if nearest_after is None:
+        return nearest_before
 
     # Check if the nearest keyframe is within the transition
     if nearest_before >= transition_start and nearest_after <= transition_end:
@@ -67,6 +378,26 @@ def find_nearest_keyframe(keyframes, transition_start, transition_end):
         return nearest_after
 
 
+def nearest_keyframe_batch(keyframes, black_frames):
+    """Snap every transition to its nearest keyframe in one batch.
+
+    One bisect per transition over the shared sorted keyframes list, with
+    the black segment's end as the fallback when no keyframe qualifies.
+
+    Args:
+        keyframes: A sorted list of keyframe timestamps.
+        black_frames: A sorted list of (start, end) black segments.
+
+    Returns:
+        A list of snapped timestamps aligned with black_frames.
+    """
+    snapped = []
+    for start, end in black_frames:
+        keyframe = find_nearest_keyframe(keyframes, start, end)
+        snapped.append(keyframe if keyframe else end)
+    return snapped
+
+
 # Parse the merge scenes input
 def parse_merge_scenes(input_str):
     if not input_str:
@@ -79,103 +410,141 @@ def parse_merge_scenes(input_str):
     return merge_list
 
 
-# Helper function to check if a scene should be merged
-def should_merge(scene_number):
-    for start, end in merge_scenes:
-        if start <= scene_number < end:
-            return True
-    return False
-
-
-# Set up argument parser
-parser = argparse.ArgumentParser(description="Video Scene Splitter with Keyframe Detection")
-parser.add_argument("video_file", help="Path to the input video file.")
-parser.add_argument("--duration", type=float, default=0.5, help="Minimum duration (in seconds) of a black scene to be considered a transition (default: 0.5s).")
-parser.add_argument("--pic_th", type=float, default=0.98, help="Picture black ratio threshold for black frame detection, representing the minimum percentage of pixels that are considered black for the entire picture to be considered black (0-1, default: 0.98). Higher values require more pixels to be black to be considered a black frame.")
-parser.add_argument("--pix_th", type=float, default=0.2, help="Pixel threshold for black frame detection, representing the maximum brightness level (0-1, default: 0.2). Lower values require each pixel to be less bright to be considered black.")
-parser.add_argument("--merge", type=str, help="Specify scenes to merge in the format '3-5,6-7'.")
-args = parser.parse_args()
-
-video_file = args.video_file
-duration = args.duration
-pic_th = args.pic_th
-pix_th = args.pix_th
-merge_scenes = parse_merge_scenes(args.merge)
-
-min_scene_duration = 300  # Minimum duration for a scene in seconds (5 minutes)
-intro_time_limit = 300    # Time limit for the intro in seconds (5 minutes)
-
-# Extract the file extension
-_, file_extension = os.path.splitext(video_file)
-
-# Detect black frames using ffmpeg
-print("Detecting black frames, please wait...")
-ffmpeg_detect_cmd = ['ffmpeg', '-i', video_file, '-vf', f'blackdetect=d={duration}:pic_th={pic_th}:pix_th={pix_th}', '-an', '-f', 'rawvideo', '-y', '/dev/null']
-black_frames_output = run_command(ffmpeg_detect_cmd)
-
-# Detect keyframes using ffprobe
-print("Detecting keyframes, please wait...")
-ffprobe_cmd = ['ffprobe', '-select_streams', 'v', '-skip_frame', 'nokey', '-show_frames', '-show_entries', 'frame=pkt_pts_time', '-of', 'csv=p=0', video_file]
-keyframes_output = run_command(ffprobe_cmd)
-
-# Extract keyframe timestamps from the ffprobe output and sort them
-keyframe_pattern = r'\d+\.\d+'  # Regex pattern to match timestamps
-keyframes = sorted(set(float(match) for match in re.findall(keyframe_pattern, keyframes_output) if match))
-
-# Find black frame ranges and sort them
-black_frames = re.findall(r'black_start:(\d+\.?\d+).*?black_end:(\d+\.?\d+)', black_frames_output)
-black_frames = map(lambda x: (float(x[0]), float(x[1])), black_frames)
-black_frames = sorted(black_frames, key=lambda x: x[0])
-
-# Determine the end of the intro
-intro_end = 0.0
-for start, end in black_frames:
-    if start < intro_time_limit:
-        scene_end = find_nearest_keyframe(keyframes, start, end)
-        intro_end = max(intro_end, scene_end if scene_end else end)
+# Expand the merge ranges into a set for O(1) scene number lookups
+def build_merge_set(merge_scenes):
+    return frozenset(n for start, end in merge_scenes for n in range(start, end))
+
+
+def main():
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description="Video Scene Splitter with Keyframe Detection")
+    parser.add_argument("video_file", help="Path to the input video file.")
+    parser.add_argument("--duration", type=float, default=0.5, help="Minimum duration (in seconds) of a black scene to be considered a transition (default: 0.5s).")
+    parser.add_argument("--pic_th", type=float, default=0.98, help="Picture black ratio threshold for black frame detection, representing the minimum percentage of pixels that are considered black for the entire picture to be considered black (0-1, default: 0.98). Higher values require more pixels to be black to be considered a black frame.")
+    parser.add_argument("--pix_th", type=float, default=0.2, help="Pixel threshold for black frame detection, representing the maximum brightness level (0-1, default: 0.2). Lower values require each pixel to be less bright to be considered black.")
+    parser.add_argument("--merge", type=str, help="Specify scenes to merge in the format '3-5,6-7'.")
+    parser.add_argument("--detect_height", type=int, default=360, help="Height (in pixels) to downscale frames to during black frame detection, or 0 to detect at the source resolution (default: 360). Detection gets much faster on high-resolution sources with no accuracy loss.")
+    parser.add_argument("--jobs", type=int, default=0, help="Number of ffmpeg processes to run in parallel when extracting scenes (default: half the CPU cores).")
+    parser.add_argument("--cpu-only", action="store_true", help="Disable GPU acceleration and use the CPU for decoding during black frame detection.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the detection cache.")
+    parser.add_argument("--refresh-cache", action="store_true", help="Redo detection even if cached results exist.")
+    args = parser.parse_args()
+
+    video_file = args.video_file
+    duration = args.duration
+    pic_th = args.pic_th
+    pix_th = args.pix_th
+    merge_scenes = parse_merge_scenes(args.merge)
+    should_merge = build_merge_set(merge_scenes).__contains__
+
+    min_scene_duration = 300  # Minimum duration for a scene in seconds (5 minutes)
+    intro_time_limit = 300    # Time limit for the intro in seconds (5 minutes)
+
+    # Extract the file extension
+    _, file_extension = os.path.splitext(video_file)
+
+    # Bail out before the expensive detection passes on degenerate inputs:
+    # a file shorter than one minimum-length scene can never be split
+    container_length = container_duration(video_file)
+    if container_length is not None and container_length <= min_scene_duration:
+        sys.exit(f"'{video_file}' is only {container_length:.2f}s long, nothing to split.")
+
+    # Reuse cached detection results when the video and the detection
+    # parameters are unchanged (e.g. when reruning to tweak --merge)
+    cache_path = None if args.no_cache else detection_cache_path(video_file, duration, pic_th, pix_th, args.detect_height)
+    cached = None
+    if cache_path and not args.refresh_cache:
+        cached = load_detection_cache(cache_path)
+
+    if cached:
+        print("Using cached detection results...")
+        black_frames, keyframes, end_time = cached
     else:
-        break
-
-# Process intro if it exists
-if intro_end > 0:
-    print(f"Processing intro (ends at {intro_end}s)...")
-    output_file = f'Intro{file_extension}'
-    ffmpeg_intro_cmd = ['ffmpeg', '-ss', '0', '-i', video_file, '-t', str(intro_end), '-c', 'copy', output_file]
-    subprocess.run(ffmpeg_intro_cmd)
-
-# Process each scene
-scene_start = intro_end
-scene_number = 1
-premerge_start = intro_end
-premerge_scene_number = 1
-for start, end in black_frames:
-    scene_end = find_nearest_keyframe(keyframes, start, end)
-    duration = scene_end - scene_start
-    premerge_duration = scene_end - premerge_start
-
-    if scene_end and premerge_duration >= min_scene_duration:
-        if should_merge(premerge_scene_number):
+        # Black frame detection and keyframe probing read the same file
+        # independently, so run them concurrently
+        print("Detecting black frames and keyframes, please wait...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            black_frames_future = executor.submit(detect_black_frames, video_file, duration, pic_th, pix_th, args.detect_height, args.cpu_only)
+            keyframes_future = executor.submit(detect_keyframes, video_file)
+            black_frames, end_time = black_frames_future.result()
+            keyframes = keyframes_future.result()
+        if cache_path:
+            save_detection_cache(cache_path, black_frames, keyframes, end_time)
+
+    # Snap each transition to its nearest keyframe and determine the end of
+    # the intro in a single pass over the black frames
+    intro_end = 0.0
+    # Preallocate at the upper bound (every black frame is a transition)
+    # and trim afterwards, avoiding repeated list growth
+    all_transitions = [None] * len(black_frames)
+    transition_count = 0
+    snapped_transitions = nearest_keyframe_batch(keyframes, black_frames)
+    for (start, _), snapped in zip(black_frames, snapped_transitions):
+        if start < intro_time_limit:
+            intro_end = max(intro_end, snapped)
+        elif snapped > intro_end:
+            all_transitions[transition_count] = snapped
+            transition_count += 1
+    del all_transitions[transition_count:]
+
+    # Collect all split points and output names before running anything so the
+    # video can be cut in a single pass
+    split_points = []
+    output_names = []
+
+    # Process intro if it exists
+    if intro_end > 0:
+        print(f"Found intro (ends at {intro_end}s)...")
+        split_points.append(intro_end)
+        output_names.append(f'Intro{file_extension}')
+
+    # Process each scene
+    scene_start = intro_end
+    scene_number = 1
+    premerge_start = intro_end
+    premerge_scene_number = 1
+    for scene_end in all_transitions:
+        premerge_duration = scene_end - premerge_start
+
+        if premerge_duration >= min_scene_duration:
+            if should_merge(premerge_scene_number):
+                # Merging costs nothing: the inner transition is simply not
+                # added to split_points, so the segment muxer never cuts there
+                # and the surrounding footage stays one stream-copied segment.
+                # Merging non-contiguous scenes would need the concat demuxer
+                # (ffmpeg -f concat -safe 0 -i list.txt -c copy), still with no
+                # re-encode.
+                premerge_start = scene_end
+                premerge_scene_number += 1
+                continue
+            output_file = f'Scene {scene_number}{file_extension}'
+            print(f"Found scene {scene_number} (starts at {scene_start}s, ends at {scene_end}s)...")
+            split_points.append(scene_end)
+            output_names.append(output_file)
+            scene_start = scene_end
             premerge_start = scene_end
+            scene_number += 1
             premerge_scene_number += 1
-            continue
+
+    # Process the ending; the duration normally comes from the detect pass
+    # stderr, falling back to the container duration probed at startup
+    if end_time is None:
+        end_time = container_length
+    if end_time is not None and end_time - scene_start > 0:
+        duration = end_time - scene_start
         output_file = f'Scene {scene_number}{file_extension}'
-        print(f"Processing scene {scene_number} (starts at {scene_start}s, ends at {scene_end}s)...")
-        ffmpeg_scene_cmd = ['ffmpeg', '-ss', str(scene_start), '-i', video_file, '-t', str(duration), '-c', 'copy', output_file]
-        subprocess.run(ffmpeg_scene_cmd)
-        scene_start = scene_end
-        premerge_start = scene_end
-        scene_number += 1
-        premerge_scene_number += 1
-
-# Process the ending
-end_time = float(run_command(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_file]))  # Get the duration of the video
-if end_time - scene_start > 0:
-    duration = end_time - scene_start
-    output_file = f'Scene {scene_number}{file_extension}'
-    if duration < min_scene_duration:
-        output_file = f'Outro{file_extension}'
-    print(f"Processing scene (starts at {scene_start}s)...")
-    ffmpeg_ending_cmd = ['ffmpeg', '-ss', str(scene_start), '-i', video_file, '-c', 'copy', output_file]
-    subprocess.run(ffmpeg_ending_cmd)
-
-print("Video splitting completed.")
+        if duration < min_scene_duration:
+            output_file = f'Outro{file_extension}'
+        print(f"Found scene (starts at {scene_start}s)...")
+        output_names.append(output_file)
+    elif split_points:
+        # The last scene already runs to the end of the file
+        split_points.pop()
+
+    split_video(video_file, split_points, output_names, args.jobs)
+
+    print("Video splitting completed.")
+
+
+if __name__ == '__main__':
+    main()